@@ -0,0 +1,36 @@
+'''
+Micro-benchmark for routers/scoring.py.
+Run from the repo root: python -m benchmarks.bench_scoring [n]
+Prints scores per second for the single and batch paths as JSON.
+'''
+import json, random, sys, time
+from routers import scoring
+
+def main(n=200000):
+    rng = random.Random(0)
+    items = [
+        (rng.randint(0, 600), rng.randint(0, 7), rng.randint(6, 12), rng.randint(15, 23), rng.randint(0, 23), rng.randint(0, 6))
+        for _ in range(n)
+    ]
+    scoring.calibrate("mission", [rng.randint(0, 40) for _ in range(24)])
+    calibrated = [item + ("mission",) for item in items]
+
+    results = {}
+
+    start = time.perf_counter()
+    for item in items:
+        scoring.score(*item)
+    results["single"] = n / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    scoring.score_batch(items)
+    results["batch"] = n / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    scoring.score_batch(calibrated)
+    results["batch_calibrated"] = n / (time.perf_counter() - start)
+
+    print(json.dumps({"n": n, "scores_per_second": {k: round(v) for k, v in results.items()}}, indent=2))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
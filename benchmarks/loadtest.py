@@ -0,0 +1,427 @@
+'''
+Load-test and memory-profile harness for the FastAPI app.
+
+Starts local stand-ins for CivicHub and the Google Maps / Geocoding APIs, runs
+main:app under uvicorn with --workers N against them and replays a weighted
+request mix. Then profiles scrape_civic_hub's fetch/parse path in-process on a
+large fixture with tracemalloc.
+
+Run from the repo root:
+    python -m benchmarks.loadtest --workers 2 --duration 20 --out loadtest.json
+
+The result is JSON (per-route RPS and latency percentiles, peak server RSS,
+tracemalloc peak and top allocators) so runs can be diffed between commits.
+
+The stub upstream runs in its own process and the load is generated by
+--client-procs processes, so neither competes with the client threads for one
+GIL; client_cpu_max near 1.0 means the generator, not the server, was the
+bottleneck. Every run gets a fresh GEO_MEMO_PATH / CACHE_PATH so worker counts
+do not share warm memos. A 200 whose JSON "status" is negative counts as an error.
+
+Requests are sent with "Connection: close" by default. Against uvicorn --workers
+2+, reused keep-alive connections add a flat ~40ms to every response (1.9ms
+fresh vs 44ms reused on "/"), which is transport, not server time, and would
+swamp the worker-count comparison. --connections keep-alive measures reused
+connections anyway; each run reports a keep_alive_probe either way, with
+"artifact": true when reuse is that much slower than fresh connections.
+
+Mix files are JSONL, one request per line:
+    {"method": "POST", "path": "/scraper/scrape-civic-hub/?neighborhood=mission", "weight": 5}
+with an optional "json" body and "route" label (defaults to the path without
+its query string). Claude and Apify are not stubbed, so routes that call them
+either fail fast (no key configured) or reach the real services.
+'''
+import argparse, json, multiprocessing, os, random, resource, socket, subprocess, sys, tempfile, threading, time, tracemalloc, zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MIX = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mix.jsonl")
+
+CATEGORIES = ["Larceny Theft", "Assault", "Drug Offense", "Robbery", "Burglary", "Malicious Mischief", "Weapons Offense"]
+STREETS = ["MISSION ST", "VALENCIA ST", "16TH ST", "24TH ST", "MARKET ST", "FOLSOM ST", "HOWARD ST"]
+
+def incident_page(rows, seed=0):
+    '''
+    CivicHub-style HTML page with a single incident table of the given size.
+    '''
+    rng = random.Random(seed)
+    out = ["<html><body><table><tr>"]
+    out += [f"<th>{h}</th>" for h in ["Date", "Time", "Incident #", "Location", "District", "CategorySFPD", "Description", "Resolution"]]
+    out.append("</tr>")
+    for i in range(rows):
+        out.append(
+            "<tr>"
+            f"<td>10/{rng.randint(1, 28):02d}/2025</td>"
+            f"<td>{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}</td>"
+            f"<td>{250000000 + i}</td>"
+            f"<td>{rng.choice(STREETS)} \\ {rng.choice(STREETS)}</td>"
+            "<td>Mission</td>"
+            f"<td>{rng.choice(CATEGORIES)}</td>"
+            "<td>Stub incident description</td>"
+            "<td>Open or Active</td>"
+            "</tr>"
+        )
+    out.append("</table></body></html>")
+    return "".join(out)
+
+class Upstream(BaseHTTPRequestHandler):
+    rows = 300
+    pages = {}
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body, content_type, headers=None):
+        data = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path.startswith("/civic/"):
+            slug = path.rsplit("/", 1)[-1]
+            if slug not in self.pages:
+                self.pages[slug] = incident_page(self.rows, seed=zlib.crc32(slug.encode()))
+            etag = f'"{slug}-{self.rows}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self._send(self.pages[slug], "text/html", {"ETag": etag})
+        elif path.startswith("/distance"):
+            self._send(json.dumps({"rows": [{"elements": [{"distance": {"text": "0.8 mi"}}]}]}), "application/json")
+        elif path.startswith("/geocode"):
+            rng = random.Random(zlib.crc32(self.path.encode()))
+            location = {"lat": 37.75 + rng.random() / 50, "lng": -122.43 + rng.random() / 50}
+            self._send(json.dumps({"results": [{"geometry": {"location": location}}]}), "application/json")
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _serve_upstream(port, rows):
+    Upstream.rows = rows
+    Upstream.pages = {}
+    ThreadingHTTPServer(("127.0.0.1", port), Upstream).serve_forever()
+
+def start_upstream(rows):
+    '''
+    Starts the stub upstream in a child process; returns (process, port).
+    '''
+    port = free_port()
+    proc = multiprocessing.Process(target=_serve_upstream, args=(port, rows), daemon=True)
+    proc.start()
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return proc, port
+        except OSError:
+            time.sleep(0.05)
+    proc.terminate()
+    raise RuntimeError("stub upstream did not start")
+
+def upstream_env(port):
+    '''
+    Environment pointing the app at the stub upstream, with fresh memo / cache files.
+    '''
+    base = f"http://127.0.0.1:{port}"
+    tmp = tempfile.mkdtemp()
+    return {
+        "CIVIC_HUB_BASE": f"{base}/civic",
+        "MAPS_URL": f"{base}/distance?",
+        "MAPS_API": "stub",
+        "GOOGLE_GEOCODING_URL": f"{base}/geocode?",
+        "GOOGLE_GEOCODING_API": "stub",
+        "GEO_MEMO_PATH": os.path.join(tmp, "geo_memo.sqlite3"),
+        "CACHE_PATH": os.path.join(tmp, "cache.sqlite3"),
+        "CACHE_WARM_ENABLED": "0",
+    }
+
+def process_tree_rss(pid):
+    '''
+    Summed RSS in bytes of pid and all its descendants (Linux /proc only).
+    '''
+    total = 0
+    stack = [pid]
+    while stack:
+        p = stack.pop()
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+            for tid in os.listdir(f"/proc/{p}/task"):
+                with open(f"/proc/{p}/task/{tid}/children") as f:
+                    stack += [int(c) for c in f.read().split()]
+        except (FileNotFoundError, ProcessLookupError, PermissionError):
+            continue
+    return total
+
+def load_mix(path):
+    mix = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                entry.setdefault("method", "GET")
+                entry.setdefault("weight", 1)
+                entry.setdefault("route", entry["path"].split("?", 1)[0])
+                mix.append(entry)
+    return mix
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, max(0, round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+def succeeded(r):
+    '''
+    True for a 2xx/3xx whose body, if it is a JSON object, has no negative "status".
+    '''
+    if r.status_code >= 400:
+        return False
+    try:
+        body = r.json()
+    except ValueError:
+        return True
+    status = body.get("status") if isinstance(body, dict) else None
+    return not (isinstance(status, int) and status < 0)
+
+def probe_keep_alive(base_url, n=20):
+    '''
+    p50 of GET / over one reused connection vs a fresh connection per request.
+    '''
+    def p50(headers):
+        session = requests.Session()
+        session.headers.update(headers)
+        values = []
+        for _ in range(n):
+            start = time.perf_counter()
+            session.get(base_url + "/", timeout=10)
+            values.append(time.perf_counter() - start)
+        values.sort()
+        return percentile(values, 50) * 1000
+
+    reused = p50({})
+    fresh = p50({"Connection": "close"})
+    return {
+        "keep_alive_p50_ms": round(reused, 2),
+        "fresh_p50_ms": round(fresh, 2),
+        "artifact": reused > 2 * fresh + 10,
+    }
+
+def _load_client(base_url, mix, duration, threads, seed, keep_alive=False):
+    '''
+    One load-generator process: threads sessions replaying mix until duration is up.
+    Returns (latencies, errors, cpu seconds used by this process).
+    '''
+    latencies = {e["route"]: [] for e in mix}
+    errors = {e["route"]: 0 for e in mix}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    cpu_start = time.process_time()
+
+    def worker(i):
+        rng = random.Random(seed + i)
+        session = requests.Session()
+        if not keep_alive:
+            session.headers["Connection"] = "close"
+        weights = [e["weight"] for e in mix]
+        while time.perf_counter() < deadline:
+            entry = rng.choices(mix, weights)[0]
+            start = time.perf_counter()
+            try:
+                r = session.request(entry["method"], base_url + entry["path"], json=entry.get("json"), timeout=60)
+                ok = succeeded(r)
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies[entry["route"]].append(elapsed)
+                if not ok:
+                    errors[entry["route"]] += 1
+
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(worker, range(threads)))
+    return latencies, errors, time.process_time() - cpu_start
+
+def run_load(base_url, mix, duration, concurrency, seed, procs=1, keep_alive=False):
+    procs = max(1, min(procs, concurrency))
+    split = [concurrency // procs + (1 if i < concurrency % procs else 0) for i in range(procs)]
+    seeds = [seed + sum(split[:i]) for i in range(procs)]
+    latencies = {e["route"]: [] for e in mix}
+    errors = {e["route"]: 0 for e in mix}
+    cpu = []
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(procs) as pool:
+        futures = [pool.submit(_load_client, base_url, mix, duration, split[i], seeds[i], keep_alive) for i in range(procs)]
+        for f in futures:
+            lat, err, used = f.result()
+            for route in lat:
+                latencies[route] += lat[route]
+                errors[route] += err[route]
+            cpu.append(used)
+    wall = time.perf_counter() - start
+
+    routes = {}
+    for route, values in latencies.items():
+        values.sort()
+        routes[route] = {
+            "requests": len(values),
+            "errors": errors[route],
+            "rps": round(len(values) / wall, 2),
+            "p50_ms": round(percentile(values, 50) * 1000, 2) if values else None,
+            "p90_ms": round(percentile(values, 90) * 1000, 2) if values else None,
+            "p99_ms": round(percentile(values, 99) * 1000, 2) if values else None,
+            "max_ms": round(values[-1] * 1000, 2) if values else None,
+        }
+    total = sum(r["requests"] for r in routes.values())
+    return {
+        "wall_s": round(wall, 2),
+        "requests": total,
+        "rps": round(total / wall, 2),
+        "client_procs": procs,
+        "client_cpu_max": round(max(cpu) / wall, 2),
+        "routes": routes,
+    }
+
+def serve_and_load(args, upstream_port, workers):
+    env = upstream_env(upstream_port)
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT,
+        env={**os.environ, **env, "PYTHONPATH": ROOT},
+        # the app prints progress; keep it out of the JSON report on stdout
+        stdout=sys.stderr,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    peak = {"rss": 0}
+    sampling = threading.Event()
+
+    def sample():
+        while not sampling.is_set():
+            peak["rss"] = max(peak["rss"], process_tree_rss(server.pid))
+            time.sleep(0.2)
+
+    try:
+        for _ in range(100):
+            try:
+                requests.get(base_url + "/", timeout=1)
+                break
+            except requests.RequestException:
+                time.sleep(0.2)
+        else:
+            raise RuntimeError("uvicorn did not start")
+
+        keep_alive = args.connections == "keep-alive"
+        probe = probe_keep_alive(base_url)
+        if keep_alive and probe["artifact"]:
+            print(f"warning: reused connections are slower than fresh ones ({probe}); latencies include it", file=sys.stderr)
+
+        threading.Thread(target=sample, daemon=True).start()
+        result = run_load(base_url, load_mix(args.mix), args.duration, args.concurrency, args.seed, args.client_procs, keep_alive)
+        sampling.set()
+        result["workers"] = workers
+        result["connections"] = args.connections
+        result["keep_alive_probe"] = probe
+        result["concurrency"] = args.concurrency
+        result["peak_rss_bytes"] = peak["rss"]
+        return result
+    finally:
+        sampling.set()
+        server.terminate()
+        server.wait(timeout=10)
+
+def profile_scrape(env, rows, top):
+    '''
+    Runs fetch_incidents in-process on a large fixture under tracemalloc.
+    '''
+    os.environ.update(env)
+    sys.path.insert(0, ROOT)
+    from routers import scraper
+
+    tracemalloc.start(25)
+    start = time.perf_counter()
+    result = scraper.fetch_incidents("loadtest-large")
+    cold = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    # second fetch exercises the conditional GET / unchanged-table path
+    start = time.perf_counter()
+    scraper.fetch_incidents("loadtest-large")
+    warm = time.perf_counter() - start
+
+    stats = snapshot.statistics("lineno")[:top]
+    return {
+        "rows": rows,
+        "parsed_rows": len(result.get("data", [])),
+        "cold_fetch_s": round(cold, 4),
+        "warm_fetch_s": round(warm, 4),
+        "tracemalloc_peak_bytes": peak,
+        "ru_maxrss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "top_allocators": [
+            {"where": f"{s.traceback[0].filename}:{s.traceback[0].lineno}", "size_bytes": s.size, "count": s.count}
+            for s in stats
+        ],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--workers", type=int, nargs="+", default=[1], help="uvicorn worker counts to test")
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--connections", choices=["close", "keep-alive"], default="close", help="fresh connection per request, or reuse one per client thread")
+    parser.add_argument("--client-procs", type=int, default=min(4, os.cpu_count() or 1), help="load-generator processes sharing --concurrency")
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--rows", type=int, default=300, help="incident rows per stub CivicHub page")
+    parser.add_argument("--profile-rows", type=int, default=20000, help="rows in the tracemalloc fixture")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--skip-profile", action="store_true")
+    parser.add_argument("--out", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    report = {"timestamp": time.time(), "python": sys.version.split()[0], "load": [], "profile": None}
+
+    if not args.skip_load:
+        upstream, upstream_port = start_upstream(args.rows)
+        try:
+            for workers in args.workers:
+                report["load"].append(serve_and_load(args, upstream_port, workers))
+        finally:
+            upstream.terminate()
+
+    if not args.skip_profile:
+        upstream, upstream_port = start_upstream(args.profile_rows)
+        try:
+            report["profile"] = profile_scrape(upstream_env(upstream_port), args.profile_rows, args.top)
+        finally:
+            upstream.terminate()
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -10,9 +10,11 @@ from datetime import timedelta
 from pydantic import BaseModel
 import logging
 from dotenv import load_dotenv
+from contextlib import asynccontextmanager
 
 # Use absolute imports for routers so this file can be executed as a top-level module
 from routers import scraper, location
+from routers.warmer import warmer
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -21,7 +23,13 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmer.start()
+    yield
+    warmer.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS
 origins = ["*"]
@@ -79,7 +87,8 @@ async def debug():
             "python_version": sys.version,
             "env_variables": env_status,
             "cwd": os.getcwd(),
-            "files_in_cwd": os.listdir(os.getcwd())
+            "files_in_cwd": os.listdir(os.getcwd()),
+            "cache_warmer": warmer.status()
         }
     except Exception as e:
         logger.error(f"Error in debug route: {str(e)}")
@@ -0,0 +1,354 @@
+import time, threading, os, json, sqlite3, tempfile, hashlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+try:
+    import fcntl
+except Exception:
+    fcntl = None
+
+# CACHE_BACKEND=sqlite shares the TTL caches between uvicorn / gunicorn workers on
+# one host through a SQLite WAL file; the default keeps them in-process.
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory")
+CACHE_PATH = os.environ.get("CACHE_PATH", os.path.join(tempfile.gettempdir(), "cal_hacks_cache.sqlite3"))
+# fill locks are striped over a fixed pool so they don't grow with the key space
+LOCK_STRIPES = int(os.environ.get("CACHE_LOCK_STRIPES", 64))
+
+def _stripe(*parts) -> int:
+    return int(hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest(), 16) % LOCK_STRIPES
+
+# Simple caches shared by the routers. Values are kept as plain JSON-style data
+# (lists / dicts / numbers) so they can be handed straight back to the client.
+
+class TTLCache:
+    def __init__(self, ttl: float, max_entries: int = 512):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data: Dict[Hashable, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+    def get(self, key):
+        '''
+        Returns the cached value, or None if missing / expired.
+        '''
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        with self._lock:
+            if len(self._data) >= self.max_entries and key not in self._data:
+                # drop whatever expires soonest
+                oldest = min(self._data, key=lambda k: self._data[k][0])
+                del self._data[oldest]
+            self._data[key] = (time.time() + (ttl if ttl is not None else self.ttl), value)
+
+    def get_or_set(self, key, fill: Callable[[], Any], ttl: Optional[float] = None):
+        '''
+        Returns the cached value for key, calling fill() to compute it on a miss.
+        fill() returning None is treated as a failure and is not cached.
+        '''
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self.lock(key):
+            # someone else may have filled it while we waited
+            value = self.get(key)
+            if value is not None:
+                return value
+            value = fill()
+            if value is not None:
+                self.set(key, value, ttl)
+        return value
+
+    @contextmanager
+    def lock(self, key):
+        '''
+        Held while filling key, so concurrent misses only call upstream once.
+        Keys share one of LOCK_STRIPES locks, so unrelated keys of this cache may wait on
+        each other: only hold it around short fills.
+        '''
+        with self._key_locks[_stripe(repr(key))]:
+            yield
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def expires_in(self, key) -> Optional[float]:
+        '''
+        Seconds until key expires (None if not cached).
+        '''
+        with self._lock:
+            item = self._data.get(key)
+        if item is None:
+            return None
+        return item[0] - time.time()
+
+    def keys(self) -> List[Hashable]:
+        with self._lock:
+            return list(self._data.keys())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+def _connect(path: str):
+    '''
+    Opens a SQLite connection suited to several processes sharing the file:
+    WAL journal, autocommit and a generous busy timeout.
+    '''
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+class MemoCache:
+    '''
+    LRU memo cache backed by a SQLite file, so lookups survive restarts.
+    Keys are strings; values are anything json can encode. Entries never expire;
+    the in-memory LRU holds max_entries and the table is trimmed to max_disk_entries
+    (least recently written first). Disk errors are logged and ignored - the memo
+    is only an optimization.
+    '''
+    def __init__(self, path: str, namespace: str, max_entries: int = 4096, max_disk_entries: Optional[int] = None):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries or max_entries * 8
+        self._mem: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._pid = None
+        self._sets = 0
+        self.persistent = True
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db()
+        except Exception as e:
+            # read-only filesystem etc. - fall back to memory only
+            print(f"Memo cache {namespace} running without disk store: {e}")
+            self.persistent = False
+
+    def _db(self):
+        # connections must not cross a fork (gunicorn --preload)
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = _connect(self.path)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS memo (namespace TEXT, key TEXT, value TEXT, used REAL, PRIMARY KEY (namespace, key))")
+            try:
+                # files written before the used column existed
+                self._conn.execute("ALTER TABLE memo ADD COLUMN used REAL")
+            except sqlite3.OperationalError:
+                pass
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key: str):
+        with self._lock:
+            if key in self._mem:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return self._mem[key]
+
+            value = None
+            if self.persistent:
+                try:
+                    row = self._db().execute("SELECT value FROM memo WHERE namespace = ? AND key = ?", (self.namespace, key)).fetchone()
+                    if row is not None:
+                        value = json.loads(row[0])
+                        self._remember(key, value)
+                except Exception as e:
+                    print(f"Memo cache {self.namespace} read failed: {e}")
+
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._remember(key, value)
+            if not self.persistent:
+                return
+            try:
+                db = self._db()
+                db.execute("INSERT OR REPLACE INTO memo (namespace, key, value, used) VALUES (?, ?, ?, ?)", (self.namespace, key, json.dumps(value), time.time()))
+                self._sets += 1
+                if self._sets % 100 == 0:
+                    self._trim(db)
+            except Exception as e:
+                print(f"Memo cache {self.namespace} write failed: {e}")
+
+    def _trim(self, db):
+        db.execute(
+            "DELETE FROM memo WHERE namespace = ? AND key IN "
+            "(SELECT key FROM memo WHERE namespace = ? ORDER BY used DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.max_disk_entries),
+        )
+
+    def _remember(self, key, value):
+        self._mem[key] = value
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    def stats(self):
+        return {"entries": len(self._mem), "hits": self.hits, "misses": self.misses, "persistent": self.persistent}
+
+class SQLiteCache:
+    '''
+    TTLCache backed by a SQLite WAL file, shared by every process on the host.
+    Writes are single INSERT OR REPLACE statements (atomic); fills are serialized
+    across processes with an flock on one of the namespace's LOCK_STRIPES lock files
+    so only one worker calls upstream. Decoded values are memoized per process (an LRU
+    of max_entries) until the stored entry changes. Opening the file fails in __init__ (so make_cache can
+    fall back); later read / write errors are logged and treated as misses.
+    '''
+    def __init__(self, path: str, namespace: str, ttl: float, max_entries: int = 512):
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._local: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._conn = None
+        self._pid = None
+        self._sets = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock_dir = path + ".locks"
+        os.makedirs(self._lock_dir, exist_ok=True)
+        self._db()
+
+    def _db(self):
+        # connections must not cross a fork
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = _connect(self.path)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS cache (namespace TEXT, key TEXT, expires REAL, value TEXT, PRIMARY KEY (namespace, key))")
+            self._pid = os.getpid()
+            self._local = OrderedDict()
+        return self._conn
+
+    def _remember(self, k, expires, value):
+        self._local[k] = (expires, value)
+        self._local.move_to_end(k)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    def _key(self, key) -> str:
+        return json.dumps(key)
+
+    def get(self, key):
+        k = self._key(key)
+        with self._lock:
+            try:
+                db = self._db()
+                row = db.execute("SELECT expires FROM cache WHERE namespace = ? AND key = ?", (self.namespace, k)).fetchone()
+                if row is None or row[0] < time.time():
+                    self._local.pop(k, None)
+                    return None
+                local = self._local.get(k)
+                if local is not None and local[0] == row[0]:
+                    self._local.move_to_end(k)
+                    return local[1]
+                row = db.execute("SELECT expires, value FROM cache WHERE namespace = ? AND key = ?", (self.namespace, k)).fetchone()
+                if row is None:
+                    return None
+                value = json.loads(row[1])
+            except Exception as e:
+                print(f"Shared cache {self.namespace} read failed: {e}")
+                return None
+            self._remember(k, row[0], value)
+            return value
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        k = self._key(key)
+        expires = time.time() + (ttl if ttl is not None else self.ttl)
+        data = json.dumps(value)
+        with self._lock:
+            try:
+                db = self._db()
+                db.execute("INSERT OR REPLACE INTO cache (namespace, key, expires, value) VALUES (?, ?, ?, ?)", (self.namespace, k, expires, data))
+                self._remember(k, expires, value)
+                self._sets += 1
+                if self._sets % 100 == 0:
+                    now = time.time()
+                    db.execute("DELETE FROM cache WHERE expires < ?", (now,))
+                    for stale in [lk for lk, (e, _) in self._local.items() if e < now]:
+                        del self._local[stale]
+            except Exception as e:
+                print(f"Shared cache {self.namespace} write failed: {e}")
+
+    def get_or_set(self, key, fill: Callable[[], Any], ttl: Optional[float] = None):
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self.lock(key):
+            value = self.get(key)
+            if value is not None:
+                return value
+            value = fill()
+            if value is not None:
+                self.set(key, value, ttl)
+        return value
+
+    @contextmanager
+    def lock(self, key):
+        '''
+        Cross-process lock for filling key (thread lock + flock on a striped lock file).
+        Stripes are per namespace, so a slow fill only ever delays keys of the same cache.
+        '''
+        stripe = _stripe(self.namespace, self._key(key))
+        with self._key_locks[stripe]:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self._lock_dir, f"{self.namespace}-{stripe:03d}.lock"), "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def delete(self, key):
+        k = self._key(key)
+        with self._lock:
+            self._db().execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, k))
+            self._local.pop(k, None)
+
+    def expires_in(self, key) -> Optional[float]:
+        with self._lock:
+            row = self._db().execute("SELECT expires FROM cache WHERE namespace = ? AND key = ?", (self.namespace, self._key(key))).fetchone()
+        if row is None:
+            return None
+        return row[0] - time.time()
+
+    def keys(self) -> List[Hashable]:
+        with self._lock:
+            rows = self._db().execute("SELECT key FROM cache WHERE namespace = ? AND expires >= ?", (self.namespace, time.time())).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def __len__(self):
+        return len(self.keys())
+
+def make_cache(namespace: str, ttl: float, max_entries: int = 512):
+    '''
+    Returns a TTL cache for namespace on the configured CACHE_BACKEND.
+    '''
+    if CACHE_BACKEND == "sqlite":
+        try:
+            return SQLiteCache(CACHE_PATH, namespace, ttl, max_entries)
+        except Exception as e:
+            print(f"Shared cache unavailable for {namespace}, using in-process cache: {e}")
+    return TTLCache(ttl, max_entries)
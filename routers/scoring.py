@@ -0,0 +1,87 @@
+import os, zlib
+from datetime import datetime
+from typing import Iterable, List, Optional, Sequence
+
+# Safety score engine. Every term of the /safety-metric/ formula is precomputed
+# into a lookup table at import, so scoring is a handful of list lookups and is
+# fully deterministic for the same inputs (safe to cache).
+
+BASE_SCORE = 18
+MIN_SCORE, MAX_SCORE = 15, 88
+JITTER = float(os.environ.get("SCORE_JITTER", 1.0))
+
+# crime-count curve: (min(count / 150, 3) ** 1.55) * 20, flat past 450 incidents
+CRIME_CAP = 450
+CRIME_LUT = [(min(c / 150, 3.0) ** 1.55) * 20 for c in range(CRIME_CAP + 1)]
+
+# police-presence curve: none nearby is worst, 5+ stations adds nothing
+POLICE_CAP = 5
+POLICE_LUT = [10.0] + [(POLICE_CAP - n) * 2.2 for n in range(1, POLICE_CAP)] + [0.0]
+
+# weekdays (Mon-Fri) add 1, weekends add 3
+WEEKDAY_LUT = [1, 1, 1, 1, 1, 3, 3]
+
+# time-of-day term for [safest_earliest, safest_latest] windows: +3 inside, +5 outside
+TIME_LUT = [
+    [[3 if low <= h <= high else 5 for h in range(24)] for high in range(24)]
+    for low in range(24)
+]
+
+# per-neighborhood calibration: neighborhood -> (version, hour -> multiplier on the time term)
+_calibration = {}
+
+def hour_factors(by_hour: Sequence[int], lo: float = 0.5, hi: float = 2.0) -> List[float]:
+    '''
+    Turns an hourly incident histogram into time-term multipliers:
+    hours with more incidents than average weigh more, clamped to [lo, hi].
+    '''
+    total = sum(by_hour)
+    if not total:
+        return [1.0] * 24
+    mean = total / 24
+    return [min(max(n / mean, lo), hi) for n in by_hour]
+
+def calibrate(neighborhood: str, by_hour: Sequence[int], version=None):
+    _calibration[neighborhood] = (version, hour_factors(by_hour))
+
+def is_calibrated(neighborhood: str, version=None) -> bool:
+    '''
+    True if neighborhood is calibrated from exactly this version of its incident set.
+    '''
+    return neighborhood in _calibration and _calibration[neighborhood][0] == version
+
+def _jitter(*key):
+    if not JITTER:
+        return 0.0
+    # stable pseudo-random offset in [-JITTER, JITTER] derived from the inputs
+    h = zlib.crc32(repr(key).encode())
+    return (h / 0xFFFFFFFF * 2 - 1) * JITTER
+
+def score(crime_count: int, num_p_stations: int, low: int, high: int, hour: int, weekday: int, neighborhood: Optional[str] = None) -> float:
+    '''
+    Returns the 0-100 danger score. Same inputs always give the same score.
+    '''
+    low = min(max(low, 0), 23)
+    high = min(max(high, 0), 23)
+    time_term = TIME_LUT[low][high][hour]
+    calibration = _calibration.get(neighborhood) if neighborhood else None
+    if calibration is not None:
+        time_term *= calibration[1][hour]
+
+    s = BASE_SCORE + time_term + WEEKDAY_LUT[weekday]
+    s += POLICE_LUT[min(max(num_p_stations, 0), POLICE_CAP)]
+    s += CRIME_LUT[min(max(crime_count, 0), CRIME_CAP)]
+    s = max(MIN_SCORE, min(s, MAX_SCORE))
+    s += _jitter(crime_count, num_p_stations, low, high, hour, weekday, neighborhood)
+
+    return max(0, min(round(s, 1), 100))
+
+def score_at(crime_count, num_p_stations, low, high, at: Optional[datetime] = None, neighborhood=None) -> float:
+    at = at or datetime.now()
+    return score(crime_count, num_p_stations, low, high, at.hour, at.weekday(), neighborhood)
+
+def score_batch(items: Iterable[tuple]) -> List[float]:
+    '''
+    Scores many (crime_count, num_p_stations, low, high, hour, weekday[, neighborhood]) tuples.
+    '''
+    return [score(*item) for item in items]
@@ -1,11 +1,15 @@
-from fastapi import FastAPI, APIRouter
-from pydantic import BaseModel
+from fastapi import FastAPI, APIRouter, Query
+from pydantic import BaseModel, Field
 from dotenv import load_dotenv
-import os, requests, json, re, csv
-from typing import List, Dict
-from datetime import datetime
+import os, requests, json, re, csv, time, bisect, asyncio, tempfile, hashlib, queue, threading
+from typing import List, Dict, Optional, Annotated
+from datetime import datetime, date, timedelta
 from bs4 import BeautifulSoup
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from routers.cache import MemoCache, make_cache
+from routers.warmer import warmer
+from routers.spatial import GridIndex
+from routers import scoring
 
 load_dotenv()
 
@@ -47,6 +51,55 @@ GEO_KEY = os.environ.get("GOOGLE_GEOCODING_API")
 CIVIC_HUB_BASE = os.environ.get("CIVIC_HUB_BASE")
 SPACE = " "
 
+# CIVIC HUB INCIDENT CACHE
+INCIDENT_HEADERS = [
+    "Date", "Time", "Incident #", "Location",
+    "District", "CategorySFPD", "Description", "Resolution"
+]
+INCIDENT_TIME_FORMATS = ["%H:%M", "%H:%M:%S", "%I:%M %p", "%I:%M%p"]
+INCIDENT_DATE_FORMATS = ["%m/%d/%Y", "%Y-%m-%d", "%Y/%m/%d", "%m/%d/%y", "%b %d, %Y"]
+CIVIC_HUB_TTL = float(os.environ.get("CIVIC_HUB_TTL", 900))
+incident_cache = make_cache("incidents", CIVIC_HUB_TTL)
+_incident_indexes = {}
+# per-neighborhood validators / table hash / parsed rows from the last fetch
+_page_state = {}
+TABLE_RE = re.compile(r"<table\b.*?</table\s*>", re.I | re.S)
+TR_RE = re.compile(r"<tr\b.*?</tr\s*>", re.I | re.S)
+TR_OPEN_RE = re.compile(r"<tr\b", re.I)
+TABLE_OPEN_RE = re.compile(r"<table\b", re.I)
+MAX_COMPARE = 10
+
+# APIFY POLICE SEARCH
+POLICE_KEEP = ["title", "address", "phone", "location"]
+APIFY_PAGE_SIZE = 50
+APIFY_POLL_INTERVAL = float(os.environ.get("APIFY_POLL_INTERVAL", 2))
+APIFY_TERMINAL_STATUSES = {"SUCCEEDED", "FAILED", "ABORTED", "TIMED-OUT"}
+APIFY_RUN_TIMEOUT = float(os.environ.get("APIFY_RUN_TIMEOUT", 300))
+WARM_POLICE_MAX_SEARCH = int(os.environ.get("WARM_POLICE_MAX_SEARCH", 20))
+POLICE_TTL = float(os.environ.get("POLICE_TTL", 86400))
+police_cache = make_cache("police", POLICE_TTL)
+
+# CLAUDE RESPONSE CACHE
+CLAUDE_TTL = float(os.environ.get("CLAUDE_TTL", 3600))
+claude_cache = make_cache("claude", CLAUDE_TTL)
+
+# GEOCODE / DISTANCE MEMO
+# COORD_PRECISION is the number of decimals kept when keying distances (4 ~ 11m, 3 ~ 110m)
+COORD_PRECISION = int(os.environ.get("COORD_PRECISION", 4))
+GEO_MEMO_PATH = os.environ.get("GEO_MEMO_PATH", os.path.join(tempfile.gettempdir(), "geo_memo.sqlite3"))
+GEO_MEMO_SIZE = int(os.environ.get("GEO_MEMO_SIZE", 4096))
+GEO_MEMO_DISK_SIZE = int(os.environ.get("GEO_MEMO_DISK_SIZE", GEO_MEMO_SIZE * 8))
+geocode_memo = MemoCache(GEO_MEMO_PATH, "geocode", GEO_MEMO_SIZE, GEO_MEMO_DISK_SIZE)
+distance_memo = MemoCache(GEO_MEMO_PATH, "distance", GEO_MEMO_SIZE, GEO_MEMO_DISK_SIZE)
+
+# INCIDENT SPATIAL INDEX
+INCIDENT_GEO_SUFFIX = os.environ.get("INCIDENT_GEO_SUFFIX", "San Francisco, CA")
+incident_grid = GridIndex()
+NEARBY_MAX_RADIUS = 25
+NEARBY_INDEX_BATCH = int(os.environ.get("NEARBY_INDEX_BATCH", 50))
+_indexing = set()
+_indexing_lock = threading.Lock()
+
 if Firecrawl is not None:
     try:
         firecrawl = Firecrawl(api_key=os.environ.get("FIRE_KEY"))
@@ -72,13 +125,27 @@ class Crime(BaseModel):
     state: str = "California"
     user_stats: Dict[str, str]
     transport: str = "walk"
-    time: datetime = datetime.now()
+    time: datetime = Field(default_factory=datetime.now)
 
 class PublicSentiment(BaseModel):
     neighborhood: str
     city: str
     state: str
 
+class NeighborhoodComparison(BaseModel):
+    neighborhoods: List[str] = Field(max_length=MAX_COMPARE)
+    user_stats: Dict[str, str]
+    transport: str = "walk"
+    time: datetime = Field(default_factory=datetime.now)
+    stream: bool = False
+
+class NearbyIncidents(BaseModel):
+    coords: List[str]
+    radius: float = Field(0.5, gt=0, le=NEARBY_MAX_RADIUS)
+    days: int = Field(30, ge=0, description="look-back window in days; 0 means all time")
+    neighborhoods: List[str] = Field([], max_length=MAX_COMPARE)
+    include_incidents: bool = False
+
 class PoliceStations(BaseModel):
     coords: List[str]
     neighborhood: str
@@ -87,6 +154,7 @@ class PoliceStations(BaseModel):
     transport: str = "walk"
     max_search: int
     radius: float
+    max_results: Optional[int] = None
 
 # RESPONSE SCHEMA FOR CRIME-RECS:
 
@@ -151,6 +219,8 @@ class SafetyMetric(BaseModel):
     # crime: Crime
     crime_count: int
     num_p_stations: int
+    neighborhood: Optional[str] = None
+    at: Optional[datetime] = None
 
 # SAMPLE CRIME-RECS RESPONSE / SCHEMA
 @router.get("/safety-analysis", response_model=SafetyAnalysisResponse)
@@ -200,6 +270,9 @@ async def crime_recs(nhood: Crime):
     try:
         # Scrape data
         n_hood_stats = await scrape_civic_hub(nhood.neighborhood)
+        if n_hood_stats.status_code == 200:
+            # only neighborhoods that actually resolved are worth warming
+            warmer.record("nhood", _nhood_slug(nhood.neighborhood))
         n_hood_stats = json.loads(n_hood_stats.body)
         print(n_hood_stats)
         print("*" * 100)
@@ -227,12 +300,89 @@ async def crime_recs(nhood: Crime):
     except Exception as e:
         return {"status": -1, "error_message": f"Failed to find crime stats: {e}"}
     
-@router.post("/scrape-civic-hub/")
-async def scrape_civic_hub(neighborhood: str):
+def _nhood_slug(neighborhood):
     neighborhood = neighborhood.lower()
     if " " in neighborhood:
         first, end = neighborhood.split(" ", 1)
         neighborhood = f"{first}-{end}"
+    return neighborhood
+
+def _parse_table_soup(page_html):
+    '''
+    Full BeautifulSoup parse of the first <table> on the page (the original scraper logic).
+    Returns (rows, {}), or None for a missing or 289-row placeholder table.
+    '''
+    table = BeautifulSoup(page_html, "html.parser").find("table")
+    if not table:
+        return None
+    rows = table.find_all("tr")
+    if len(rows) == 289:
+        return None
+
+    # Extract header row if it exists
+    headers_row = [th.get_text(strip=True) for th in rows[0].find_all("th")] if rows and rows[0].find_all("th") else INCIDENT_HEADERS
+
+    # Normalize header names to match expected ones
+    headers_row = [h if h in INCIDENT_HEADERS else INCIDENT_HEADERS[i] for i, h in enumerate(headers_row)]
+
+    table_data = []
+    for row in rows[1:]:
+        values = [cell.get_text(strip=True) for cell in row.find_all("td")]
+        if len(values) == len(headers_row):
+            table_data.append(dict(zip(headers_row, values)))
+    return table_data, {}
+
+def _parse_table_rows(neighborhood, table_html, page_html):
+    '''
+    Parses the <tr> rows of the incident table. Rows whose raw HTML was already parsed on an
+    earlier fetch (same hash) are reused, so only new or changed rows go through BeautifulSoup.
+    Falls back to a full soup parse when the regex split can't be trusted (rows without
+    </tr>, nested tables).
+    Returns (rows, rows_by_hash), or None for the 289-row placeholder table.
+    '''
+    chunks = TR_RE.findall(table_html)
+    opened = len(TR_OPEN_RE.findall(table_html))
+    nested = len(TABLE_OPEN_RE.findall(table_html)) > 1
+    if not chunks or opened != len(chunks) or nested:
+        return _parse_table_soup(page_html)
+    if len(chunks) == 289:
+        return None
+
+    previous = _page_state.get(neighborhood, {}).get("rows_by_hash", {})
+
+    # Extract header row if it exists
+    ths = BeautifulSoup(chunks[0], "html.parser").find_all("th")
+    headers_row = [th.get_text(strip=True) for th in ths] if ths else INCIDENT_HEADERS
+
+    # Normalize header names to match expected ones
+    headers_row = [h if h in INCIDENT_HEADERS else INCIDENT_HEADERS[i] for i, h in enumerate(headers_row)]
+
+    table_data = []
+    rows_by_hash = {}
+    for chunk in chunks[1:]:
+        # the header row is part of the hash so a header change re-parses everything
+        h = hashlib.sha1((chunks[0] + chunk).encode()).hexdigest()
+        if h in previous:
+            entry = previous[h]
+        else:
+            values = [td.get_text(strip=True) for td in BeautifulSoup(chunk, "html.parser").find_all("td")]
+            entry = dict(zip(headers_row, values)) if len(values) == len(headers_row) else None
+        rows_by_hash[h] = entry
+        if entry is not None:
+            table_data.append(entry)
+
+    return table_data, rows_by_hash
+
+def fetch_incidents(neighborhood):
+    '''
+    Scrapes the CivicHub page for a neighborhood.
+    Returns {"status": 0, "data": [incident rows], "fetched_at": ts, "new_incidents": n}
+    (rows without the crime_amount element), or {"status": -1, "error_message": ..., "code": http status}.
+    Sends ETag / Last-Modified validators from the previous fetch, and skips parsing
+    when the raw <table> region hasn't changed; fetched_at only moves when the rows do.
+    '''
+    neighborhood = _nhood_slug(neighborhood)
+    state = _page_state.get(neighborhood)
 
     try:
         headers = {
@@ -242,46 +392,50 @@ async def scrape_civic_hub(neighborhood: str):
                 'Chrome/91.0.4472.124 Safari/537.36'
             )
         }
+        if state:
+            if state.get("etag"):
+                headers["If-None-Match"] = state["etag"]
+            if state.get("last_modified"):
+                headers["If-Modified-Since"] = state["last_modified"]
 
         url = f"{CIVIC_HUB_BASE}/{neighborhood}"
         print(f"Fetching: {url}")
 
         response = requests.get(url, headers=headers, timeout=30)
+        if response.status_code == 304 and state:
+            return {"status": 0, "data": state["rows"], "fetched_at": state["fetched_at"], "new_incidents": 0}
         response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
-
-        table = soup.find("table")
-
-        # Define expected headers
-        expected_headers = [
-            "Date", "Time", "Incident #", "Location",
-            "District", "CategorySFPD", "Description", "Resolution"
-        ]
 
-        if table:
-            rows = table.find_all("tr")
-            if len(rows) != 289:
-                table_data = []
-
-                # Extract header row if it exists
-                headers_row = [th.get_text(strip=True) for th in rows[0].find_all("th")] if rows and rows[0].find_all("th") else expected_headers
-
-                # Normalize header names to match expected ones
-                headers_row = [h if h in expected_headers else expected_headers[i] for i, h in enumerate(headers_row)]
-
-                # Process data rows
-                for row in rows[1:]:
-                    cells = row.find_all("td")
-                    values = [cell.get_text(strip=True) for cell in cells]
-
-                    # Zip headers and values into a dictionary
-                    if len(values) == len(headers_row):
-                        entry = dict(zip(headers_row, values))
-                        table_data.append(entry)
+        table_match = TABLE_RE.search(response.text)
+        if table_match:
+            table_hash = hashlib.sha1(table_match.group(0).encode()).hexdigest()
+            if state and state["table_hash"] == table_hash:
+                state["etag"] = response.headers.get("ETag")
+                state["last_modified"] = response.headers.get("Last-Modified")
+                return {"status": 0, "data": state["rows"], "fetched_at": state["fetched_at"], "new_incidents": 0}
+
+            parsed = _parse_table_rows(neighborhood, table_match.group(0), response.text)
+            # an empty table is treated like no table, never cached as a valid incident set
+            if parsed is not None and parsed[0]:
+                table_data, rows_by_hash = parsed
+
+                # diff by Incident # against the previous fetch
+                old_ids = {r.get("Incident #") for r in state["rows"]} if state else set()
+                new_incidents = sum(1 for r in table_data if r.get("Incident #") not in old_ids)
+                print(f"{neighborhood}: {new_incidents} new incidents")
+
+                fetched_at = time.time()
+                _page_state[neighborhood] = {
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "table_hash": table_hash,
+                    "rows_by_hash": rows_by_hash,
+                    "rows": table_data,
+                    "fetched_at": fetched_at,
+                }
+                return {"status": 0, "data": table_data, "fetched_at": fetched_at, "new_incidents": new_incidents}
 
-                # Add total count
-                table_data.append({"crime_amount": len(table_data)})
-                return JSONResponse(content=table_data)
+        soup = BeautifulSoup(response.text, "html.parser")
 
         # If no <table>, try finding JSON/CSV in script tags
         scripts = soup.find_all("script")
@@ -306,33 +460,184 @@ async def scrape_civic_hub(neighborhood: str):
                     # Transform each row into dictionary format
                     formatted = []
                     for item in raw_data:
-                        entry = dict(zip(expected_headers, item[:len(expected_headers)]))
+                        entry = dict(zip(INCIDENT_HEADERS, item[:len(INCIDENT_HEADERS)]))
                         formatted.append(entry)
 
-                    formatted.append({"crime_amount": len(formatted)})
-                    return JSONResponse(content=formatted)
+                    return {"status": 0, "data": formatted, "fetched_at": time.time()}
 
                 elif "text/csv" in data_resp.headers.get("Content-Type", ""):
                     lines = data_resp.text.splitlines()
-                    reader = csv.DictReader(lines, fieldnames=expected_headers)
+                    reader = csv.DictReader(lines, fieldnames=INCIDENT_HEADERS)
                     formatted = [row for row in reader]
-                    formatted.append({"crime_amount": len(formatted) - 1})
-                    return JSONResponse(content=formatted)
+                    # first CSV line is the header row
+                    return {"status": 0, "data": formatted[1:], "fetched_at": time.time()}
 
             except Exception as e:
                 print(f"Failed to fetch data from detected API: {e}")
 
-        return JSONResponse(content={"error": "No valid data found"}, status_code=404)
+        return {"status": -1, "error_message": "No valid data found", "code": 404}
 
     except Exception as e:
-        return JSONResponse(content={"error": str(e)}, status_code=500)
+        return {"status": -1, "error_message": str(e), "code": 500}
+
+def get_incidents(neighborhood):
+    '''
+    Cached wrapper around fetch_incidents.
+    Returns the incident set for a neighborhood: {"status": 0, "data": rows, "fetched_at": ts}.
+    '''
+    slug = _nhood_slug(neighborhood)
+    failed = {}
+
+    def fill():
+        result = fetch_incidents(slug)
+        if result["status"] == 0:
+            return result
+        failed["result"] = result
+        return None
+
+    cached = incident_cache.get_or_set(slug, fill)
+    return cached if cached is not None else failed["result"]
+
+def refresh_incidents(neighborhood):
+    '''
+    Re-scrapes a neighborhood and replaces its cached incident set on success.
+    Skips the scrape if another worker refreshed it while we waited for the lock.
+    '''
+    slug = _nhood_slug(neighborhood)
+    with incident_cache.lock(slug):
+        remaining = incident_cache.expires_in(slug)
+        if remaining is not None and remaining > warmer.ahead:
+            return incident_cache.get(slug)
+        result = fetch_incidents(slug)
+        if result["status"] == 0:
+            incident_cache.set(slug, result)
+    return result
+
+def _parse_incident_date(value):
+    for fmt in INCIDENT_DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), fmt).date()
+        except (ValueError, AttributeError):
+            continue
+    return None
+
+def incident_index(neighborhood, incidents):
+    '''
+    Builds (once per fetched incident set) a date index over the rows:
+    a list of (date ordinal, row position) sorted by date, for bisecting date ranges.
+    '''
+    slug = _nhood_slug(neighborhood)
+    built = _incident_indexes.get(slug)
+    if built is not None and built[0] == incidents["fetched_at"]:
+        return built[1]
+
+    index = []
+    for pos, row in enumerate(incidents["data"]):
+        d = _parse_incident_date(row.get("Date", ""))
+        if d is not None:
+            index.append((d.toordinal(), pos))
+    index.sort()
+    _incident_indexes[slug] = (incidents["fetched_at"], index)
+    return index
+
+def query_incidents(neighborhood, incidents, start_date=None, end_date=None):
+    '''
+    Returns the incident rows inside [start_date, end_date], keeping the page order.
+    '''
+    rows = incidents["data"]
+    if start_date is None and end_date is None:
+        return rows
+
+    index = incident_index(neighborhood, incidents)
+    lo = bisect.bisect_left(index, (start_date.toordinal(), -1)) if start_date else 0
+    hi = bisect.bisect_right(index, (end_date.toordinal(), len(rows))) if end_date else len(index)
+    positions = sorted(pos for _, pos in index[lo:hi])
+    return [rows[pos] for pos in positions]
+
+@router.post("/scrape-civic-hub/")
+async def scrape_civic_hub(
+    neighborhood: str,
+    limit: Annotated[Optional[int], Query(ge=1)] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    count_only: bool = False,
+):
+    '''
+    Returns the CivicHub incidents for a neighborhood.
+    With no options, returns every row followed by {"crime_amount": N}.
+    limit / cursor paginate, fields is a comma separated column list (e.g. "Time,CategorySFPD"),
+    start_date / end_date filter on the Date column and count_only returns just the count.
+    A cursor is only valid for the incident set it was issued from; once that set is
+    refreshed the request fails with 409 and the client should start over.
+    '''
+    columns = None
+    if fields is not None:
+        columns = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [c for c in columns if c not in INCIDENT_HEADERS]
+        if unknown or not columns:
+            return JSONResponse(content={"error": f"Unknown fields: {unknown}. Valid fields: {INCIDENT_HEADERS}"}, status_code=422)
+
+    incidents = await asyncio.to_thread(get_incidents, neighborhood)
+    if incidents["status"] != 0:
+        return JSONResponse(content={"error": incidents["error_message"]}, status_code=incidents["code"])
+
+    if limit is None and cursor is None and columns is None and start_date is None and end_date is None and not count_only:
+        table_data = list(incidents["data"])
+        table_data.append({"crime_amount": len(table_data)})
+        return JSONResponse(content=table_data)
+
+    rows = query_incidents(neighborhood, incidents, start_date, end_date)
+    if count_only:
+        return JSONResponse(content={"status": 0, "data": {"crime_amount": len(rows)}})
+
+    # cursor is "<fetched_at>:<offset>" so it can't silently skip / repeat rows across a refresh
+    offset = 0
+    if cursor is not None:
+        try:
+            version, offset = cursor.rsplit(":", 1)
+            offset = int(offset)
+        except ValueError:
+            return JSONResponse(content={"error": "Invalid cursor"}, status_code=422)
+        if offset < 0:
+            return JSONResponse(content={"error": "Invalid cursor"}, status_code=422)
+        if version != _cursor_version(incidents):
+            return JSONResponse(content={"error": "Cursor expired, the incident set was refreshed"}, status_code=409)
+
+    end = len(rows) if limit is None else offset + limit
+    page = rows[offset:end]
+
+    if columns:
+        page = [{c: row.get(c) for c in columns} for row in page]
+
+    next_cursor = f"{_cursor_version(incidents)}:{end}" if end < len(rows) else None
+    return JSONResponse(content={"status": 0, "data": page, "crime_amount": len(rows), "next_cursor": next_cursor})
+
+def _cursor_version(incidents):
+    return f"{incidents['fetched_at']:.6f}"
 
 # @router.post("/claude-digest/")
 def claude_compose(user, nhood, transport, time=datetime.now()):
     '''
     Runs user profile and data scraped through Claude
     Returns a set of recommendations and analysis based on the data.
+    Responses are cached on the inputs, with time bucketed to the hour.
     '''
+    key = hashlib.sha1(json.dumps([user, nhood, transport, f"{time:%Y-%m-%d %H}"], sort_keys=True, default=str).encode()).hexdigest()
+    failed = {}
+
+    def fill():
+        result = _claude_compose(user, nhood, transport, time)
+        if isinstance(result, dict) and isinstance(result.get("status"), int) and result["status"] < 0:
+            failed["result"] = result
+            return None
+        return result
+
+    cached = claude_cache.get_or_set(key, fill)
+    return cached if cached is not None else failed["result"]
+
+def _claude_compose(user, nhood, transport, time):
     # If Anthropic client isn't configured, return a clear error
     if client is None:
         return {"status": -1, "error_message": "Anthropic client not configured (CLAUDE_API_KEY missing or anthropic package not installed)"}
@@ -398,6 +703,241 @@ Follow this exact JSON schema for all responses:
     except Exception as e:
         return {"status": -1, "error_message": str(e)}
 
+# NEIGHBORHOOD COMPARISON
+
+def _incident_hour(value):
+    for fmt in INCIDENT_TIME_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), fmt).hour
+        except (ValueError, AttributeError):
+            continue
+    return None
+
+def summarize_incidents(rows):
+    '''
+    Aggregates incident rows locally.
+    Returns the crime_amount plus counts by CategorySFPD and by hour of day.
+    '''
+    by_category = {}
+    by_hour = [0] * 24
+    for row in rows:
+        category = row.get("CategorySFPD") or "Unknown"
+        by_category[category] = by_category.get(category, 0) + 1
+        hour = _incident_hour(row.get("Time", ""))
+        if hour is not None:
+            by_hour[hour] += 1
+
+    return {
+        "crime_amount": len(rows),
+        "by_category": dict(sorted(by_category.items(), key=lambda kv: -kv[1])),
+        "by_hour": by_hour,
+    }
+
+def _neighborhood_result(neighborhood, incidents):
+    if incidents["status"] != 0:
+        return {"neighborhood": neighborhood, "status": -1, "error_message": incidents["error_message"]}
+    return {"neighborhood": neighborhood, "status": 0, "data": summarize_incidents(incidents["data"])}
+
+def rank_neighborhoods(results):
+    '''
+    Orders neighborhoods safest first (fewest incidents); failed lookups go last.
+    '''
+    ok = sorted((r for r in results if r["status"] == 0), key=lambda r: r["data"]["crime_amount"])
+    failed = [r for r in results if r["status"] != 0]
+    ranking = []
+    for i, r in enumerate(ok):
+        ranking.append({"rank": i + 1, **r})
+    return ranking + failed
+
+def claude_compare(user, ranking, transport, time=None):
+    '''
+    Single Claude call covering every compared neighborhood.
+    Returns per-neighborhood recommendations keyed by neighborhood name.
+    '''
+    time = time or datetime.now()
+    if client is None:
+        return {"status": -1, "error_message": "Anthropic client not configured (CLAUDE_API_KEY missing or anthropic package not installed)"}
+
+    summaries = {r["neighborhood"]: r["data"] for r in ranking if r["status"] == 0}
+    if not summaries:
+        return {"recommendations": {}}
+
+    try:
+        message = client.messages.create(
+            model="claude-sonnet-4-5-20250929",
+            max_tokens=20000,
+            temperature=1,
+            messages=[
+    {
+        "role": "user",
+        "content": [
+            {
+                "type": "text",
+                "text": f"""
+Provide ONLY a valid JSON output — nothing else.
+Do NOT include reasoning, explanations, or commentary in your response. All analysis should be internal.
+
+You are provided with a user profile of {user} and aggregated incident data for several neighborhoods: {summaries}.
+Each neighborhood has a crime_amount, counts by_category and counts by_hour (index 0 is midnight).
+Using ONLY the data provided — do NOT extrapolate, estimate, or add missing data — give 3 sentences of advice per neighborhood, no more than 50 characters each, tailored to the {transport} mode of transport and the time {time}. Then give one sentence comparing the neighborhoods.
+
+Rules:
+- Respond ONLY in JSON format using the schema below.
+- Do NOT include markdown, comments, or text outside JSON.
+- Use the neighborhood names exactly as given as keys.
+- Do not fabricate times, counts, or incidents — only use what is present in the data.
+
+Follow this exact JSON schema for all responses:
+    "recommendations": {{"<neighborhood>": [rec1, rec2, rec3], ...}},
+    "comparison": "sentence"
+"""
+            }
+        ]
+    }
+]
+        )
+
+        raw_text = message.content[0].text.strip()
+        clean_text = re.sub(r'^```json\n|\n```$', '', raw_text)
+        try:
+            return json.loads(clean_text)
+        except json.JSONDecodeError:
+            return {"status": -2, "error_message": "Invalid JSON returned by Claude", "raw_output": clean_text}
+
+    except Exception as e:
+        return {"status": -1, "error_message": str(e)}
+
+@router.post("/compare-neighborhoods/")
+async def compare_neighborhoods(comp: NeighborhoodComparison):
+    '''
+    Scrapes every requested neighborhood concurrently, aggregates them locally and
+    makes one combined Claude call. Returns the neighborhoods ranked safest first.
+    With stream=True, returns NDJSON: one line per neighborhood as it resolves, then
+    a final line with the ranking and recommendations.
+    '''
+    neighborhoods = []
+    seen = set()
+    for n in comp.neighborhoods:
+        slug = _nhood_slug(n)
+        if slug not in seen:
+            seen.add(slug)
+            neighborhoods.append(n)
+
+    if not neighborhoods:
+        return {"status": -1, "error_message": f"Provide between 1 and {MAX_COMPARE} neighborhoods"}
+
+    async def resolve(n):
+        return _neighborhood_result(n, await asyncio.to_thread(get_incidents, n))
+
+    async def finish(results):
+        ranking = rank_neighborhoods(results)
+        recs = await asyncio.to_thread(claude_compare, comp.user_stats, ranking, comp.transport, comp.time)
+        return {"ranking": ranking, "recommendations": recs}
+
+    if not comp.stream:
+        results = await asyncio.gather(*(resolve(n) for n in neighborhoods))
+        return {"status": 0, "data": await finish(results)}
+
+    async def lines():
+        results = []
+        for task in asyncio.as_completed([resolve(n) for n in neighborhoods]):
+            result = await task
+            results.append(result)
+            yield json.dumps({"type": "neighborhood", **result}) + "\n"
+        yield json.dumps({"type": "final", "status": 0, "data": await finish(results)}, default=str) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+# NEARBY INCIDENTS
+
+def _incident_address(location):
+    # CivicHub intersections look like "MISSION ST \ 16TH ST"
+    location = re.sub(r"\s*[\\/]\s*", " & ", location.strip())
+    return f"{location}, {INCIDENT_GEO_SUFFIX}"
+
+def index_incidents(neighborhood, limit=None):
+    '''
+    Geocodes the neighborhood's incidents (once each, through the geocode memo) into incident_grid.
+    At most limit new geocodes are attempted; the rest are reported as pending.
+    Returns {"status": 0, "data": added, "pending": n}, or the failed incident lookup.
+    '''
+    incidents = get_incidents(neighborhood)
+    if incidents["status"] != 0:
+        return incidents
+
+    added = 0
+    attempted = 0
+    pending = 0
+    for row in incidents["data"]:
+        incident_id = row.get("Incident #") or f"{row.get('Date')}|{row.get('Time')}|{row.get('Location')}"
+        if incident_id in incident_grid or not row.get("Location"):
+            continue
+        if limit is not None and attempted >= limit:
+            pending += 1
+            continue
+        attempted += 1
+        coords = get_coords(_incident_address(row["Location"]))
+        if coords["status"] != 0:
+            continue
+        d = _parse_incident_date(row.get("Date", ""))
+        incident_grid.add(
+            incident_id,
+            coords["data"][0],
+            coords["data"][1],
+            row,
+            d.toordinal() if d else None,
+            _incident_hour(row.get("Time", "")),
+        )
+        added += 1
+
+    return {"status": 0, "data": added, "pending": pending}
+
+def _index_in_background(neighborhood):
+    slug = _nhood_slug(neighborhood)
+    with _indexing_lock:
+        if slug in _indexing:
+            return
+        _indexing.add(slug)
+
+    def run():
+        try:
+            index_incidents(slug)
+        finally:
+            with _indexing_lock:
+                _indexing.discard(slug)
+
+    threading.Thread(target=run, daemon=True).start()
+
+@router.post("/nearby-incidents/")
+async def nearby_incidents(q: NearbyIncidents):
+    '''
+    Counts incidents within radius miles of coords in the last days days (0 = all time),
+    by CategorySFPD and hour, regardless of neighborhood borders. Neighborhoods listed are scraped and indexed first;
+    at most NEARBY_INDEX_BATCH incidents per neighborhood are geocoded inside the request and
+    the rest in the background, so the first results may be partial ("pending" > 0).
+    '''
+    try:
+        lat, lng = float(q.coords[0]), float(q.coords[1])
+    except Exception:
+        return {"status": -1, "error_message": "coords must be [lat, lon]"}
+
+    results = await asyncio.gather(*(asyncio.to_thread(index_incidents, n, NEARBY_INDEX_BATCH) for n in q.neighborhoods))
+    pending = 0
+    for n, r in zip(q.neighborhoods, results):
+        if r["status"] == 0 and r["pending"]:
+            pending += r["pending"]
+            _index_in_background(n)
+
+    since = (date.today() - timedelta(days=q.days)).toordinal() if q.days else None
+    found = incident_grid.query(lat, lng, q.radius, since)
+
+    data = summarize_incidents([p["row"] for p in found])
+    data["indexed"] = len(incident_grid)
+    data["pending"] = pending
+    if q.include_incidents:
+        data["incidents"] = [p["row"] for p in found]
+    return {"status": 0, "data": data}
+
 # POLICE
 
 @router.post("/police-stations/")
@@ -405,22 +945,24 @@ def police_stations(ps: PoliceStations):
     '''
     Finds all police stations within a certain radius.
     Returns only the police stations in the correct radius.
+    If max_results is set, returns as soon as that many are found (the run finishes in the background and is cached).
     '''
     if maps_client is None:
         return {"status": -1, "error_message": "Apify/Maps client not configured (APIFY_API missing or apify-client not installed)"}
 
-    p_stations = find_police(ps.city, ps.state, ps.max_search)
+    p_stations = stream_police(ps.city, ps.state, ps.max_search)
+
+    data = filter_police(ps.coords, p_stations, ps.radius, ps.max_results)
 
-    data = filter_police(ps.coords, p_stations, ps.radius)
+    # only warm searches that found something, and never arbitrarily large (paid) ones
+    key = _police_key(ps.city, ps.state, ps.max_search)
+    if ps.max_search <= WARM_POLICE_MAX_SEARCH and (data or police_cache.get(key) is not None):
+        warmer.record("police", *key)
 
     return {"status": 0, "data": data}
 
-def find_police(city, state, max_search):
-    '''
-    Uses Apify Google Maps scraper to find specified amount of police stations
-    Returns all police stations, amount specified.
-    '''
-    run_input = {
+def _police_run_input(city, state, max_search):
+    return {
         "searchStringsArray": ["police stations"],
         "locationQuery": f"{city}, {state}",
         "maxCrawledPlacesPerSearch": max_search,
@@ -428,29 +970,139 @@ def find_police(city, state, max_search):
         "maximumLeadsEnrichmentRecords": 0,
         "maxImages": 0,
     }
+
+def _police_key(city, state, max_search):
+    return (city.lower(), state.lower(), max_search)
+
+def stream_police(city, state, max_search, refresh=False):
+    '''
+    Starts the Apify Google Maps scraper and yields police stations as they land in the dataset,
+    projected down to POLICE_KEEP. Completed runs are cached, and served from the cache
+    unless refresh is set.
+    The search itself runs in a background thread that always finishes (or hits
+    APIFY_RUN_TIMEOUT) and fills the cache, so stopping the generator early doesn't
+    waste the run for the next caller.
+    '''
+    key = _police_key(city, state, max_search)
+    if not refresh:
+        cached = police_cache.get(key)
+        if cached is not None:
+            yield from cached
+            return
+
     if maps_client is None:
-        return []
+        return
+
+    stations = queue.Queue()
+    threading.Thread(target=_fill_police, args=(city, state, max_search, key, refresh, stations), daemon=True).start()
+    while True:
+        station = stations.get()
+        if station is None:
+            return
+        yield station
+
+def _police_claim(key):
+    return ("running", *key)
 
+def _fill_police(city, state, max_search, key, refresh, out):
+    claim = _police_claim(key)
     try:
-        run = maps_client.actor("compass/crawler-google-places").call(run_input=run_input)
-        p_stations = []
+        # only one worker runs the search for a key. The cache lock is only held to
+        # check the cache and take the claim, never for the (minutes long) Apify run;
+        # the others poll until the claim's result lands in the cache or the claim is released.
+        while True:
+            with police_cache.lock(key):
+                cached = police_cache.get(key)
+                if cached is not None and (not refresh or (police_cache.expires_in(key) or 0) > warmer.ahead):
+                    for station in cached:
+                        out.put(station)
+                    return
+                if police_cache.get(claim) is None:
+                    police_cache.set(claim, os.getpid(), APIFY_RUN_TIMEOUT + APIFY_POLL_INTERVAL)
+                    break
+            time.sleep(APIFY_POLL_INTERVAL)
 
-        for item in maps_client.dataset(run["defaultDatasetId"]).iterate_items():
-            p_stations.append(item)
+        try:
+            for station in _run_police_search(city, state, max_search, key):
+                out.put(station)
+        finally:
+            police_cache.delete(claim)
+    except Exception as e:
+        print(f"Failed to fill police stations: {e}")
+    finally:
+        out.put(None)
+
+def _run_police_search(city, state, max_search, key):
+    run_id = None
+    finished = False
+    collected = []
+    deadline = time.monotonic() + APIFY_RUN_TIMEOUT
+    try:
+        run = maps_client.actor("compass/crawler-google-places").start(
+            run_input=_police_run_input(city, state, max_search),
+            timeout_secs=int(APIFY_RUN_TIMEOUT),
+        )
+        run_id = run["id"]
+        dataset = maps_client.dataset(run["defaultDatasetId"])
+        offset = 0
+
+        while True:
+            if time.monotonic() > deadline:
+                print(f"Police search for {key} timed out after {APIFY_RUN_TIMEOUT}s, aborting")
+                return
+
+            # read the run status before the items so nothing written in between is missed
+            status = (maps_client.run(run_id).get() or {}).get("status")
+            page = dataset.list_items(offset=offset, limit=APIFY_PAGE_SIZE)
+            for item in page.items:
+                station = {k: item.get(k) for k in POLICE_KEEP}
+                collected.append(station)
+                yield station
+            offset += len(page.items)
+
+            if status in APIFY_TERMINAL_STATUSES and not page.items:
+                finished = True
+                if status == "SUCCEEDED":
+                    police_cache.set(key, collected)
+                return
+            if not page.items:
+                time.sleep(APIFY_POLL_INTERVAL)
+    except Exception as e:
+        print(f"Failed to stream police stations: {e}")
+    finally:
+        if run_id is not None and not finished:
+            try:
+                maps_client.run(run_id).abort()
+            except Exception:
+                pass
 
-        return p_stations
+def find_police(city, state, max_search):
+    '''
+    Uses Apify Google Maps scraper to find specified amount of police stations
+    Returns all police stations, amount specified.
+    '''
+    try:
+        return list(stream_police(city, state, max_search))
     except Exception:
         return []
 
-def filter_police(og_coords, stations, radius):
+def refresh_police(city, state, max_search):
+    '''
+    Runs the full Apify search again, replacing the cached stations on success.
+    '''
+    list(stream_police(city, state, max_search, refresh=True))
+    return police_cache.get(_police_key(city, state, max_search)) is not None
+
+def filter_police(og_coords, stations, radius, limit=None):
     '''
     Filters the police findings based on radius specified
-    Returns only the ones <= to that radius.
+    Returns only the ones <= to that radius, stopping after limit matches if given.
     '''
     result = []
-    keep = ["title", "address", "phone", "location"]
 
     for p in stations:
+        if not p.get("location"):
+            continue
         # calculate the distance from the original location to the police stations
         # only add if the distance is within 1 mile (with that transport option)
         dest_coords = [p["location"]["lat"], p["location"]["lng"]]
@@ -463,24 +1115,38 @@ def filter_police(og_coords, stations, radius):
             continue
         if dist <= radius:
             temp = {}
-            for k in keep:
-                temp[k] = p[k]
+            for k in POLICE_KEEP:
+                temp[k] = p.get(k)
             temp["distance"] = dist
             result.append(temp)
+            if limit is not None and len(result) >= limit:
+                break
+
+    if hasattr(stations, "close"):
+        stations.close()
 
     return result
 
-def find_distance(origin, dest): # origin, dest are both list of coordinates
+def _quantize(coords):
+    return ",".join(f"{float(c):.{COORD_PRECISION}f}" for c in coords[:2])
+
+def find_distance(origin, dest, mode="driving"): # origin, dest are both list of coordinates
     '''
     Uses Google Maps Distance Matrix API to find distance between two points (coordinates), in miles
     Returns the mile difference of the two points
+    Results are memoized on the quantized origin / destination pair and travel mode.
     '''
     try:
+        key = f"{_quantize(origin)}|{_quantize(dest)}|{mode}"
+        cached = distance_memo.get(key)
+        if cached is not None:
+            return {"status": 0, "data": cached}
+
         if not MAPS_URL or not MAPS_KEY:
             return {"status": -1, "error_message": "MAPS_URL or MAPS_KEY not configured"}
 
         dist = -1
-        url = f"{MAPS_URL}destinations={dest[0]},{dest[1]}&origins={origin[0]},{origin[1]}&units=imperial&key={MAPS_KEY}"
+        url = f"{MAPS_URL}destinations={dest[0]},{dest[1]}&origins={origin[0]},{origin[1]}&mode={mode}&units=imperial&key={MAPS_KEY}"
         response = requests.get(url)
         r_json = response.json()
 
@@ -489,6 +1155,7 @@ def find_distance(origin, dest): # origin, dest are both list of coordinates
         ind_space = dist.find(" ")
         dist = float(dist[:ind_space])
 
+        distance_memo.set(key, dist)
         return {"status": 0, "data": dist}
     except Exception as e:
         return {"status": -1, "error_message": str(e)}
@@ -496,20 +1163,49 @@ def find_distance(origin, dest): # origin, dest are both list of coordinates
 def get_coords(address):
     '''
     Uses Google Maps Geolocation API to return coordinates from an address
+    Results are memoized on the normalized (lowercased, whitespace collapsed) address.
+    Addresses Google answers ZERO_RESULTS for are memoized too (as []), so they aren't retried;
+    errors (quota, bad key, ...) are never memoized.
     '''
     try:
+        key = " ".join(address.lower().split())
+        cached = geocode_memo.get(key)
+        if cached == []:
+            return {"status": -1, "error_message": f"No geocoding results for {address} (cached)"}
+        if cached is not None:
+            return {"status": 0, "data": cached}
+
         if not GEO_URL or not GEO_KEY:
             return {"status": -1, "error_message": "GEO_URL or GEO_KEY not configured"}
 
         url = f"{GEO_URL}address={address}&key={GEO_KEY}"
         response = requests.get(url)
         r_json = response.json()
+        if r_json.get("status") == "ZERO_RESULTS":
+            geocode_memo.set(key, [])
+            return {"status": -1, "error_message": f"No geocoding results for {address}"}
+        if not r_json.get("results"):
+            return {"status": -1, "error_message": f"Geocoding failed for {address}: {r_json.get('status')} {r_json.get('error_message', '')}".strip()}
         t_coords = r_json["results"][0]["geometry"]["location"]
         coords = [t_coords["lat"], t_coords["lng"]]
+        geocode_memo.set(key, coords)
         return {"status": 0, "data": coords}
     except Exception as e:
         return {"status": -1, "error_message": str(e)}
 
+# CACHE WARMING
+
+warmer.register(
+    "nhood",
+    lambda slug: refresh_incidents(slug)["status"] == 0,
+    incident_cache.expires_in,
+)
+warmer.register(
+    "police",
+    refresh_police,
+    lambda city, state, max_search: police_cache.expires_in(_police_key(city, state, max_search)),
+)
+
 # SOCIAL SENTIMENT (TO-DO)
 
 @router.post("/public-sentiment/")
@@ -518,67 +1214,44 @@ def pub_sent(ps: PublicSentiment):
 
 # METRIC SCORE
 
+def _calibrate_neighborhood(neighborhood):
+    '''
+    Calibrates the scoring time term from the neighborhood's incident set in incident_cache
+    (shared between workers with CACHE_BACKEND=sqlite). Nothing is kept past the cache entry:
+    without a cached incident set the score is uncalibrated.
+    Returns (slug, calibration version = the incident set's fetched_at), or (None, None).
+    '''
+    slug = _nhood_slug(neighborhood)
+    incidents = incident_cache.get(slug)
+    if incidents is None:
+        return None, None
+    if not scoring.is_calibrated(slug, incidents["fetched_at"]):
+        scoring.calibrate(slug, summarize_incidents(incidents["data"])["by_hour"], incidents["fetched_at"])
+    return slug, incidents["fetched_at"]
+
+def _score(safety: SafetyMetric):
+    nhood, version = _calibrate_neighborhood(safety.neighborhood) if safety.neighborhood else (None, None)
+    s = scoring.score_at(
+        safety.crime_count,
+        safety.num_p_stations,
+        safety.time.safest_earliest_time,
+        safety.time.safest_latest_time,
+        safety.at,
+        nhood,
+    )
+    return s, version
+
 @router.post("/safety-metric/")
 async def safety_metric(safety: SafetyMetric):
-    crime_count = safety.crime_count
-    num_p_stations = safety.num_p_stations
-    # crime = safety.crime
-    time = safety.time
-    
-    # Start lower for expanded spread
-    score = 18  
-
-    # === Time-based danger adjustment ===
-    curr_time = datetime.now().time()
-    low_time = time.safest_earliest_time
-    high_time = time.safest_latest_time
-
-    curr_hour = curr_time.hour
-
-    # Outside safe window → more danger
-    if not (low_time <= curr_hour <= high_time):
-        score += 5
-    elif low_time - 2 <= curr_hour <= high_time:
-        score += 3
-
-    # === Day of week ===
-    curr_weekday = datetime.now().weekday()
-    if curr_weekday < 5:
-        score += 1
-    else:
-        score += 3
-
-    # === Police presence ===
-    # p_data = PoliceStations(
-    #     coords=crime.coords,
-    #     neighborhood=crime.neighborhood,
-    #     city=crime.city,
-    #     state=crime.state,
-    #     max_search=5,
-    #     radius=1
-    # )
-    # num_p_stations = len(police_stations(p_data)["data"])
-
-    # More stations = safer (lower danger)
-    if num_p_stations == 0:
-        score += 10
-    elif num_p_stations < 5:
-        score += (5 - num_p_stations) * 2.2
-
-    # === Crime-based scaling ===
-    # Increase the steepness for high-crime areas
-    normalized_crime = min(crime_count / 150, 3.0)
-    crime_danger = (normalized_crime ** 1.55) * 20
-    score += crime_danger
-
-    # === Normalize and constrain ===
-    score = max(15, min(score, 88))  # widened range
-
-    # === Random variation for realism ===
-    import random
-    score += random.uniform(-1.0, 1.0)
-
-    # Round and bound to 0–100
-    score = max(0, min(round(score, 1), 100))
-
-    return {"status": 0, "data": score}
\ No newline at end of file
+    '''
+    Returns the 0-100 danger score for the current (or given) time.
+    Deterministic for the same inputs and "calibration" (the fetched_at of the incident set
+    the neighborhood was calibrated from, null if uncalibrated), so key caches on both.
+    '''
+    s, version = _score(safety)
+    return {"status": 0, "data": s, "calibration": version}
+
+@router.post("/safety-metric/batch/")
+async def safety_metric_batch(items: List[SafetyMetric]):
+    scored = [_score(s) for s in items]
+    return {"status": 0, "data": [s for s, _ in scored], "calibration": [v for _, v in scored]}
@@ -0,0 +1,69 @@
+import math, threading
+from typing import Dict, List, Optional, Tuple
+
+# In-memory grid index over geocoded incidents. Points are bucketed into square
+# cells of CELL_DEG degrees, so a radius query only looks at the few cells
+# overlapping its bounding box instead of every incident.
+
+EARTH_RADIUS_MILES = 3958.8
+CELL_DEG = 0.005  # ~0.35 miles of latitude
+
+def haversine_miles(lat1, lng1, lat2, lng2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(a))
+
+class GridIndex:
+    def __init__(self, cell_deg: float = CELL_DEG):
+        self.cell_deg = cell_deg
+        self._cells: Dict[Tuple[int, int], List[dict]] = {}
+        self._ids = set()
+        self._lock = threading.Lock()
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg))
+
+    def __contains__(self, incident_id):
+        return incident_id in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, incident_id, lat, lng, row, date_ordinal: Optional[int] = None, hour: Optional[int] = None):
+        '''
+        Adds one incident. Incidents already indexed (same incident_id) are ignored.
+        '''
+        with self._lock:
+            if incident_id in self._ids:
+                return
+            self._ids.add(incident_id)
+            self._cells.setdefault(self._cell(lat, lng), []).append({
+                "lat": lat,
+                "lng": lng,
+                "date": date_ordinal,
+                "hour": hour,
+                "row": row,
+            })
+
+    def query(self, lat, lng, radius_miles, since_ordinal: Optional[int] = None):
+        '''
+        Returns the indexed incidents within radius_miles of (lat, lng),
+        optionally only those dated on or after since_ordinal.
+        '''
+        dlat = radius_miles / 69.0
+        dlng = radius_miles / max(69.0 * math.cos(math.radians(lat)), 1e-6)
+        lo = self._cell(lat - dlat, lng - dlng)
+        hi = self._cell(lat + dlat, lng + dlng)
+
+        found = []
+        with self._lock:
+            for x in range(lo[0], hi[0] + 1):
+                for y in range(lo[1], hi[1] + 1):
+                    for p in self._cells.get((x, y), ()):
+                        if since_ordinal is not None and (p["date"] is None or p["date"] < since_ordinal):
+                            continue
+                        if haversine_miles(lat, lng, p["lat"], p["lng"]) <= radius_miles:
+                            found.append(p)
+        return found
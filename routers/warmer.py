@@ -0,0 +1,145 @@
+import asyncio, os, threading, time
+from typing import Callable, Dict, Optional, Tuple
+
+# Background cache warmer: counts how often each neighborhood / (city, state) is
+# requested and refreshes the popular ones shortly before their cache entry
+# expires, so the first user after expiry doesn't pay for the upstream calls.
+
+WARM_INTERVAL = float(os.environ.get("CACHE_WARM_INTERVAL", 60))
+WARM_AHEAD = float(os.environ.get("CACHE_WARM_AHEAD", 120))
+WARM_BUDGET = int(os.environ.get("CACHE_WARM_BUDGET", 5))
+WARM_TOP_N = int(os.environ.get("CACHE_WARM_TOP_N", 20))
+WARM_DECAY = float(os.environ.get("CACHE_WARM_DECAY", 0.9))
+WARM_ENABLED = os.environ.get("CACHE_WARM_ENABLED", "1") not in ("0", "false", "False")
+# a key whose refresh fails is skipped for interval * 2 ** failures, and dropped after WARM_MAX_FAILURES
+WARM_MAX_FAILURES = int(os.environ.get("CACHE_WARM_MAX_FAILURES", 3))
+
+class CacheWarmer:
+    def __init__(self, interval=WARM_INTERVAL, ahead=WARM_AHEAD, budget=WARM_BUDGET, top_n=WARM_TOP_N):
+        self.interval = interval
+        self.ahead = ahead
+        self.budget = budget
+        self.top_n = top_n
+        self._kinds: Dict[str, Tuple[Callable, Callable]] = {}
+        self._hits: Dict[Tuple, float] = {}
+        self._failures: Dict[Tuple, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.cycles = 0
+        self.refreshed = 0
+        self.failed = 0
+        self.last_run = None
+        self.last_refreshed = []
+
+    def register(self, kind, refresh, expires_in):
+        '''
+        refresh(*args) re-fills the cache for a key and returns True on success.
+        expires_in(*args) returns seconds until the cached entry expires (None if not cached).
+        '''
+        self._kinds[kind] = (refresh, expires_in)
+
+    def record(self, kind, *args):
+        with self._lock:
+            key = (kind, *args)
+            self._hits[key] = self._hits.get(key, 0) + 1
+
+    def hot_keys(self):
+        with self._lock:
+            ranked = sorted(self._hits.items(), key=lambda kv: -kv[1])
+        return ranked[:self.top_n]
+
+    def warm_once(self):
+        '''
+        Refreshes hot keys that are missing or about to expire, up to the upstream call budget.
+        Returns the keys refreshed.
+        '''
+        refreshed = []
+        calls = 0
+        for key, _ in self.hot_keys():
+            if calls >= self.budget:
+                break
+            kind, args = key[0], key[1:]
+            if kind not in self._kinds:
+                continue
+            with self._lock:
+                failures, retry_at = self._failures.get(key, (0, 0))
+            if retry_at > time.time():
+                continue
+            refresh, expires_in = self._kinds[kind]
+
+            # any error for this key (including reading its expiry) counts as a failed refresh
+            ok = False
+            try:
+                remaining = expires_in(*args)
+                if remaining is not None and remaining > self.ahead:
+                    continue
+                calls += 1
+                ok = refresh(*args)
+            except Exception as e:
+                print(f"Cache warmer failed to refresh {key}: {e}")
+            if ok:
+                refreshed.append(key)
+                self.refreshed += 1
+                with self._lock:
+                    self._failures.pop(key, None)
+            else:
+                self.failed += 1
+                self._backoff(key, failures + 1)
+
+        # decay the counters so yesterday's popular keys fall out eventually
+        with self._lock:
+            for key in list(self._hits):
+                self._hits[key] *= WARM_DECAY
+                if self._hits[key] < 0.1:
+                    del self._hits[key]
+
+        self.cycles += 1
+        self.last_run = time.time()
+        self.last_refreshed = [list(k) for k in refreshed]
+        return refreshed
+
+    def _backoff(self, key, failures):
+        with self._lock:
+            if failures >= WARM_MAX_FAILURES:
+                self._hits.pop(key, None)
+                self._failures.pop(key, None)
+                return
+            self._failures[key] = (failures, time.time() + self.interval * 2 ** failures)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.warm_once)
+            except Exception as e:
+                # never let one bad cycle stop warming for the life of the worker
+                print(f"Cache warmer cycle failed: {e}")
+
+    def start(self):
+        if WARM_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def status(self):
+        with self._lock:
+            backing_off = [{"key": list(k), "failures": f, "retry_at": r} for k, (f, r) in self._failures.items()]
+        return {
+            "enabled": WARM_ENABLED,
+            "running": self._task is not None and not self._task.done(),
+            "interval": self.interval,
+            "ahead": self.ahead,
+            "budget": self.budget,
+            "cycles": self.cycles,
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+            "backing_off": backing_off,
+            "last_run": self.last_run,
+            "last_refreshed": self.last_refreshed,
+            "hot_keys": [{"key": list(k), "hits": round(h, 2)} for k, h in self.hot_keys()],
+        }
+
+warmer = CacheWarmer()
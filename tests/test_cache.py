@@ -0,0 +1,86 @@
+import multiprocessing, os, sys, threading, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from routers import cache
+
+def _fill_once(path, counter, results):
+    shared = cache.SQLiteCache(path, "incidents", 60)
+
+    def fill():
+        with open(counter, "a") as f:
+            f.write("fill\n")
+        time.sleep(0.5)
+        return {"status": 0, "data": [os.getpid()]}
+
+    results.put(shared.get_or_set("mission", fill))
+
+def test_sqlite_cache_fills_once_across_processes(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    counter = str(tmp_path / "fills")
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    procs = [ctx.Process(target=_fill_once, args=(path, counter, results)) for _ in range(4)]
+    for p in procs:
+        p.start()
+    values = [results.get(timeout=30) for _ in procs]
+    for p in procs:
+        p.join(timeout=30)
+
+    with open(counter) as f:
+        assert len(f.readlines()) == 1
+    assert all(v == values[0] for v in values)
+
+def test_make_cache_falls_back_to_memory(monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_BACKEND", "sqlite")
+    monkeypatch.setattr(cache, "CACHE_PATH", "/proc/nope/cache.sqlite3")
+    fallback = cache.make_cache("incidents", 60)
+    assert isinstance(fallback, cache.TTLCache)
+    fallback.set("mission", [1])
+    assert fallback.get("mission") == [1]
+
+def test_make_cache_uses_sqlite(monkeypatch, tmp_path):
+    monkeypatch.setattr(cache, "CACHE_BACKEND", "sqlite")
+    monkeypatch.setattr(cache, "CACHE_PATH", str(tmp_path / "cache.sqlite3"))
+    shared = cache.make_cache("incidents", 60)
+    assert isinstance(shared, cache.SQLiteCache)
+    shared.set("mission", {"status": 0})
+    assert cache.make_cache("incidents", 60).get("mission") == {"status": 0}
+
+def test_sqlite_cache_read_errors_are_misses(tmp_path):
+    shared = cache.SQLiteCache(str(tmp_path / "cache.sqlite3"), "incidents", 60)
+    shared.set("mission", [1])
+    shared._db().execute("DROP TABLE cache")
+    assert shared.get("mission") is None
+    shared.set("mission", [2])  # logged, not raised
+
+def test_lock_files_are_striped(tmp_path):
+    shared = cache.SQLiteCache(str(tmp_path / "cache.sqlite3"), "incidents", 60)
+    for i in range(500):
+        with shared.lock(f"key-{i}"):
+            pass
+    assert len(os.listdir(shared._lock_dir)) <= cache.LOCK_STRIPES
+    assert len(cache.TTLCache(60)._key_locks) == cache.LOCK_STRIPES
+
+def test_namespaces_do_not_share_lock_stripes(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    police = cache.SQLiteCache(path, "police", 60)
+    incidents = cache.SQLiteCache(path, "incidents", 60)
+    stripe = cache._stripe("police", police._key("oakland"))
+    slug = next(f"n{i}" for i in range(10000) if cache._stripe("incidents", incidents._key(f"n{i}")) == stripe)
+
+    acquired = threading.Event()
+
+    def fill():
+        with incidents.lock(slug):
+            acquired.set()
+
+    with police.lock("oakland"):
+        threading.Thread(target=fill, daemon=True).start()
+        assert acquired.wait(5)
+
+def test_sqlite_cache_local_memo_is_bounded(tmp_path):
+    shared = cache.SQLiteCache(str(tmp_path / "cache.sqlite3"), "claude", 60, max_entries=50)
+    for i in range(1000):
+        shared.set(f"key-{i}", {"i": i}, ttl=0.01 if i % 2 else None)
+    assert len(shared._local) <= 50
+    assert shared.get("key-998") == {"i": 998}
@@ -0,0 +1,164 @@
+import os, sys
+import pytest
+
+if sys.version_info < (3, 12):
+    # routers/scraper.py uses PEP 701 f-strings; the deployment runs python-3.13 (runtime.txt)
+    pytest.skip("routers.scraper needs Python 3.12+", allow_module_level=True)
+pytest.importorskip("fastapi")
+pytest.importorskip("bs4")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from routers import scraper
+
+HEADER = "<tr><th>Date</th><th>Time</th><th>Incident #</th><th>Location</th><th>District</th><th>CategorySFPD</th><th>Description</th><th>Resolution</th></tr>"
+
+def row(i, close=True):
+    cells = "".join(f"<td>{v}</td>" for v in [f"10/{i % 28 + 1:02d}/2025", "12:30", 250000000 + i, "MISSION ST \\ 16TH ST", "Mission", "Assault", "desc", "Open"])
+    return f"<tr>{cells}</tr>" if close else f"<tr>{cells}"
+
+def page(body, before=""):
+    return f"<html><body>{before}<table>{body}</table></body></html>"
+
+class StubResponse:
+    def __init__(self, text="", status_code=200, headers=None):
+        self.text = text
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+@pytest.fixture
+def upstream(monkeypatch):
+    '''
+    Replaces requests.get in the scraper; append StubResponses to the returned list.
+    Request headers of every call are recorded in upstream.sent.
+    '''
+    monkeypatch.setattr(scraper, "_page_state", {})
+    monkeypatch.setattr(scraper, "incident_cache", scraper.make_cache("incidents-test", 60))
+
+    class Upstream(list):
+        pass
+
+    responses = Upstream()
+    responses.sent = []
+
+    def get(url, headers=None, timeout=None):
+        responses.sent.append(dict(headers or {}))
+        return responses.pop(0)
+
+    monkeypatch.setattr(scraper.requests, "get", get)
+    return responses
+
+@pytest.mark.parametrize("html", [
+    page(HEADER + "".join(row(i) for i in range(20))),
+    page(HEADER + "".join(row(i, close=i % 3 != 0) for i in range(20))),
+    page(HEADER + row(1) + "<tr><td><table><tr><td>inner</td></tr></table></td></tr>" + row(2)),
+    page("<thead>" + HEADER + "</thead><tbody>" + "".join(row(i) for i in range(20)) + "</tbody>"),
+], ids=["plain", "missing-close-tr", "nested-table", "thead-tbody"])
+def test_fetch_matches_full_soup_parse(upstream, html):
+    upstream.append(StubResponse(html))
+    result = scraper.fetch_incidents("mission")
+    assert result["status"] == 0
+    assert result["data"] == scraper._parse_table_soup(html)[0]
+
+def test_unchanged_rows_are_reused(upstream, monkeypatch):
+    rows = [row(i) for i in range(10)]
+    upstream.append(StubResponse(page(HEADER + "".join(rows))))
+    first = scraper.fetch_incidents("mission")
+
+    parsed = []
+    soup = scraper.BeautifulSoup
+    monkeypatch.setattr(scraper, "BeautifulSoup", lambda html, *a: parsed.append(html) or soup(html, *a))
+    upstream.append(StubResponse(page(HEADER + "".join(rows) + row(10))))
+    second = scraper.fetch_incidents("mission")
+
+    assert second["new_incidents"] == 1
+    assert second["data"][:10] == first["data"]
+    # header + the one new row; the ten known rows came from rows_by_hash
+    assert len(parsed) == 2
+
+def test_unchanged_table_short_circuits(upstream, monkeypatch):
+    body = HEADER + "".join(row(i) for i in range(10))
+    upstream.append(StubResponse(page(body)))
+    first = scraper.fetch_incidents("mission")
+
+    monkeypatch.setattr(scraper, "_parse_table_rows", lambda *a: pytest.fail("table was re-parsed"))
+    upstream.append(StubResponse(page(body, before="<p>updated banner</p>")))
+    second = scraper.fetch_incidents("mission")
+
+    assert second == {"status": 0, "data": first["data"], "fetched_at": first["fetched_at"], "new_incidents": 0}
+
+def test_not_modified_reuses_rows(upstream):
+    upstream.append(StubResponse(page(HEADER + row(1)), headers={"ETag": '"v1"', "Last-Modified": "Mon, 19 Oct 2026 00:00:00 GMT"}))
+    first = scraper.fetch_incidents("mission")
+
+    upstream.append(StubResponse(status_code=304))
+    second = scraper.fetch_incidents("mission")
+
+    assert upstream.sent[1]["If-None-Match"] == '"v1"'
+    assert upstream.sent[1]["If-Modified-Since"] == "Mon, 19 Oct 2026 00:00:00 GMT"
+    assert second["data"] == first["data"]
+    assert second["fetched_at"] == first["fetched_at"]
+
+def test_empty_table_is_not_cached(upstream):
+    upstream.append(StubResponse(page(HEADER)))
+    result = scraper.get_incidents("mission")
+    assert result["status"] == -1
+    assert scraper.incident_cache.get("mission") is None
+
+@pytest.fixture
+def civic_hub(monkeypatch):
+    '''
+    TestClient for the scraper router, serving a fixed 25-row incident set (mutate it to "refresh").
+    '''
+    pytest.importorskip("httpx")
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    incidents = {
+        "status": 0,
+        "data": [dict(zip(scraper.INCIDENT_HEADERS, [f"10/{i + 1:02d}/2025", "12:30", str(i), "loc", "Mission", "Assault", "desc", "Open"])) for i in range(25)],
+        "fetched_at": 1000.0,
+    }
+    monkeypatch.setattr(scraper, "get_incidents", lambda neighborhood: incidents)
+    app = FastAPI()
+    app.include_router(scraper.router)
+    client = TestClient(app)
+    client.incidents = incidents
+    return client
+
+def _scrape(client, **params):
+    return client.post("/scraper/scrape-civic-hub/", params={"neighborhood": "mission", **params})
+
+def test_cursor_pages_through_every_row(civic_hub):
+    seen = []
+    cursor = None
+    while True:
+        body = _scrape(civic_hub, limit=10, **({"cursor": cursor} if cursor else {})).json()
+        seen += [r["Incident #"] for r in body["data"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [str(i) for i in range(25)]
+
+def test_cursor_from_a_refreshed_set_is_409(civic_hub):
+    cursor = _scrape(civic_hub, limit=10).json()["next_cursor"]
+    civic_hub.incidents["fetched_at"] = 2000.0
+    assert _scrape(civic_hub, limit=10, cursor=cursor).status_code == 409
+
+@pytest.mark.parametrize("params", [
+    {"limit": 0},
+    {"limit": -1},
+    {"fields": "Time,Nope"},
+    {"fields": ","},
+    {"cursor": "garbage"},
+    {"cursor": "1000.000000:-5"},
+])
+def test_invalid_params_are_422(civic_hub, params):
+    assert _scrape(civic_hub, **params).status_code == 422
+
+def test_fields_project_columns(civic_hub):
+    body = _scrape(civic_hub, limit=1, fields="Time, CategorySFPD").json()
+    assert body["data"] == [{"Time": "12:30", "CategorySFPD": "Assault"}]
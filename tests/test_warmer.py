@@ -0,0 +1,35 @@
+import asyncio, os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from routers.warmer import CacheWarmer
+
+def _broken_expiry(*args):
+    raise RuntimeError("database is locked")
+
+def test_expiry_errors_back_off_the_key_only():
+    warmer = CacheWarmer(interval=60, budget=5)
+    warmer.register("nhood", lambda slug: True, _broken_expiry)
+    warmer.register("police", lambda *args: True, lambda *args: None)
+    warmer.record("nhood", "mission")
+    warmer.record("police", "oakland", "ca", 20)
+
+    assert warmer.warm_once() == [("police", "oakland", "ca", 20)]
+    assert warmer.status()["backing_off"][0]["key"] == ["nhood", "mission"]
+
+def test_run_survives_a_failed_cycle():
+    warmer = CacheWarmer(interval=0.01)
+    cycles = []
+
+    def warm_once():
+        cycles.append(1)
+        raise RuntimeError("boom")
+
+    warmer.warm_once = warm_once
+
+    async def main():
+        task = asyncio.create_task(warmer.run())
+        await asyncio.sleep(0.2)
+        task.cancel()
+
+    asyncio.run(main())
+    assert len(cycles) > 1